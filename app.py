@@ -1,294 +1,330 @@
+import functools
 import io
+import multiprocessing
+import os
 import re
 import time
 import zipfile
-from typing import List, Tuple, Dict
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple, Dict, Iterator
 
 import pandas as pd
 import streamlit as st
-import fitz  # PyMuPDF
 
-
-# ──────────────────────────────────────────────────────────────────────────────
-# STREAMLIT CONFIG
-# ──────────────────────────────────────────────────────────────────────────────
-st.set_page_config(page_title="ACC Build TOC Splitter", layout="wide")
-st.title("ACC Build TOC Splitter")
+from splitter import Split, build_parts, hash_pdf, parse_pdf
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # TEXT / REGEX HELPERS
 # ──────────────────────────────────────────────────────────────────────────────
-NBSP = "\xa0"
-
-def normalize_text(s: str) -> str:
-    if not s:
-        return ""
-    s = s.replace(NBSP, " ")
-    s = s.replace("–", "-").replace("—", "-")
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\s+\n", "\n", s)
-    s = re.sub(r"\n\s+", "\n", s)
-    return s
-
+BAD_CHARS_RX = re.compile(r'[\\/:*?"<>|]')
+WS_RX = re.compile(r"\s+")
+UNDERSCORES_RX = re.compile(r"_+")
+BREADCRUMB_SEP_RX = re.compile(r"[>/]")
+ID_PREFIX_RX = re.compile(r"^#\s*\d+:\s*")
+
+# slugify in one C-level pass: drop forbidden chars, whitespace (what `\s`
+# matches) becomes '_'
+UNICODE_WS = (
+    "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680"
+    + "".join(map(chr, range(0x2000, 0x200B)))
+    + "\u2028\u2029\u202f\u205f\u3000"
+)
+SLUG_TRANS = str.maketrans({**dict.fromkeys('\\/:*?"<>|'), **dict.fromkeys(UNICODE_WS, "_")})
 
+@functools.lru_cache(maxsize=4096)
 def slugify(s: str) -> str:
-    s = re.sub(r'[\\/:*?"<>|]', "", s)
-    s = s.strip()
-    s = re.sub(r"\s+", "_", s)
-    s = re.sub(r"_+", "_", s)
+    s = s.translate(SLUG_TRANS)
+    s = UNDERSCORES_RX.sub("_", s)
     return s.strip("_")
 
 
+@functools.lru_cache(maxsize=4096)
 def slugify_path_segment(seg: str) -> str:
     seg = seg.strip()
-    seg = re.sub(r'[\\/:*?"<>|]', "", seg)
-    seg = re.sub(r"\s+", " ", seg).strip()
+    seg = BAD_CHARS_RX.sub("", seg)
+    seg = WS_RX.sub(" ", seg).strip()
     return seg
 
 
-def build_patterns(raw: str) -> List[str]:
+def slugify_token(tok: str) -> str:
+    """Whitespace to '_' around a remove-token's '*' wildcards, as `slugify` does."""
+    # collapse '_' runs like slugify() does, or 'a _ b' never matches 'a_b'
+    return "*".join(UNDERSCORES_RX.sub("_", WS_RX.sub("_", part)) for part in tok.split("*"))
+
+
+RemovePatterns = Tuple[re.Pattern | None, re.Pattern | None]
+
+@st.cache_resource(show_spinner=False)
+def build_patterns(raw: str) -> RemovePatterns:
     """
-    Turn comma-separated user tokens into regex patterns.
+    Turn comma-separated user tokens into compiled alternations for the raw
+    title and for the slugified filename (see `build_filename`).
     Use non-greedy '*' so '0*.0*_' doesn't nuke the whole name.
+    A token with a character that `slugify` drops can only match the raw
+    title; every other token runs once, after slugify, with spaces or '_'.
+    Cached on the raw string. None for a pass with nothing to remove.
     """
-    pats: List[str] = []
+    raw_pats: List[str] = []
+    slug_pats: List[str] = []
     for tok in [t.strip() for t in raw.split(",") if t.strip()]:
-        esc = re.escape(tok)
-        esc = esc.replace(r"\*", ".*?")
-        pats.append(esc)
-    return pats
+        if BAD_CHARS_RX.search(tok.replace("*", "")):
+            variants, pats = [tok], raw_pats
+        else:
+            # match the typed token and its slugified form in a single pass
+            variants, pats = dict.fromkeys([tok, slugify_token(tok)]), slug_pats
+        for variant in variants:
+            esc = re.escape(variant)
+            esc = esc.replace(r"\*", ".*?")
+            pats.append(esc)
 
+    return tuple(re.compile("(?i)(?:" + "|".join(p) + ")") if p else None for p in (raw_pats, slug_pats))
 
-def apply_patterns(s: str, patterns: List[str]) -> str:
-    for rx in patterns:
-        s = re.sub(rx, "", s, flags=re.IGNORECASE)
-    return s
 
+def apply_patterns(s: str, patterns: re.Pattern | None) -> str:
+    if patterns is None:
+        return s
+    return patterns.sub("", s)
 
-def split_breadcrumbs(s: str) -> List[str]:
-    return [p.strip() for p in re.split(r"[>/]", s) if p.strip()]
+
+def build_filename(
+    title: str,
+    patterns: RemovePatterns,
+    prefix: str,
+    suffix: str,
+    remove_id: bool,
+) -> str:
+    raw_patterns, slug_patterns = patterns
+    base = title
+    if remove_id:
+        base = ID_PREFIX_RX.sub("", base)
+    base = apply_patterns(base, raw_patterns)
+    fname = apply_patterns(slugify(base), slug_patterns)
+    fname = UNDERSCORES_RX.sub("_", fname).strip("_")
+    return f"{prefix}{fname}{suffix}.pdf"
+
+
+@functools.lru_cache(maxsize=4096)
+def split_breadcrumbs(s: str) -> Tuple[str, ...]:
+    # tuple: the result is cached and shared between callers
+    return tuple(p.strip() for p in BREADCRUMB_SEP_RX.split(s) if p.strip())
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# TOC PARSING
+# WORKERS + SHARED RESULT STORES
 # ──────────────────────────────────────────────────────────────────────────────
-TOC_PAGE_RX = re.compile(r"^#\s*\d+:", re.MULTILINE)
-TOC_ENTRY_RX = re.compile(r"#\s*\d+:\s*(.+?)\s*\.{3,}\s*(\d+)", re.MULTILINE)
+MAX_WORKERS = 8  # each worker holds a whole source PDF (and its parts)
+PARSE_STORE_MAX_PDFS = 64
+PART_STORE_MAX_BYTES = 512 * 1024 * 1024  # split PDFs kept for re-zipping
+
+@st.cache_resource(show_spinner=False)
+def worker_pool() -> ProcessPoolExecutor:
+    """
+    One process pool for the whole server. Workers are spawned, not forked:
+    the Streamlit server is multi-threaded, and a forked child can inherit a
+    lock held by another thread and deadlock. Spawned workers import
+    `splitter` and re-run this file as `__mp_main__`, which skips `main()`.
+    """
+    return ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, MAX_WORKERS),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
 
-def detect_toc_pages(doc: fitz.Document) -> List[int]:
-    pages = []
-    for i in range(doc.page_count):
-        txt = normalize_text(doc.load_page(i).get_text())
-        if TOC_PAGE_RX.search(txt):
-            pages.append(i + 1)  # 1-based
-    return pages
 
+def parallel_map(fn, *iterables) -> Iterator:
+    """
+    `map(fn, *iterables)` on `worker_pool()`; results are yielded in input
+    order as they become available. PyMuPDF is not thread-safe, hence
+    processes; `fn` must live in `splitter` so workers can import it.
+    Arguments and results are pickled: every task ships its whole source PDF
+    to a worker and its result (parse rows or part bytes) back. Runs inline
+    for a single task or a single CPU.
+    """
+    args = list(zip(*iterables))
+    if len(args) < 2 or min(os.cpu_count() or 1, MAX_WORKERS) < 2:
+        for a in args:
+            yield fn(*a)
+        return
+    try:
+        yield from worker_pool().map(fn, *zip(*args))
+    except BrokenProcessPool:
+        worker_pool.clear()  # a worker died; start a fresh pool next time
+        raise
+
+
+@st.cache_resource(show_spinner=False)
+def result_store(kind: str) -> "OrderedDict":
+    """
+    Process-wide results shared across reruns and sessions, one LRU dict per
+    `kind`. Used instead of st.cache_data for work that runs in worker
+    processes (see `parallel_map`), which cannot fill Streamlit's caches.
+    """
+    return OrderedDict()
 
-def parse_toc(doc: fitz.Document, toc_pages: List[int]) -> List[Tuple[str, int]]:
-    entries: List[Tuple[str, int]] = []
-    for pg in toc_pages:
-        txt = normalize_text(doc.load_page(pg - 1).get_text())
-        for m in TOC_ENTRY_RX.finditer(txt):
-            title = m.group(1).strip()
-            start = int(m.group(2))
-            entries.append((title, start))
-    return entries
+
+def store_get(store: "OrderedDict", key):
+    """`store.get(key)`, marking a hit as most recently used."""
+    value = store.get(key)
+    if value is not None:
+        try:
+            store.move_to_end(key)
+        except KeyError:  # evicted by another session in between
+            pass
+    return value
 
 
-def split_ranges(entries: List[Tuple[str, int]], total_pages: int) -> List[Tuple[str, int, int]]:
-    out: List[Tuple[str, int, int]] = []
-    for i, (title, start) in enumerate(entries):
-        end = entries[i + 1][1] - 1 if i + 1 < len(entries) else total_pages
-        out.append((title, start, end))
-    return out
+def store_put(store: "OrderedDict", key, value, budget: int, cost=lambda v: 1) -> None:
+    """
+    Insert `value` as the most recently used entry, then evict the least
+    recently used ones until the summed `cost` of what is kept fits `budget`.
+    The new entry always stays.
+    """
+    store[key] = value
+    store.move_to_end(key)
+    total = sum(cost(v) for v in list(store.values()))
+    while total > budget and len(store) > 1:
+        _, old = store.popitem(last=False)
+        total -= cost(old)
+
+
+def parts_nbytes(parts: List[bytes]) -> int:
+    # repeated forms share one bytes object; count it once
+    return sum(len(b) for b in {id(b): b for b in parts}.values())
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# PER-SPLIT METADATA
+# SPLIT + ZIP (using precomputed splits/meta)
 # ──────────────────────────────────────────────────────────────────────────────
-def parse_field_from_lines(lines: List[str], field: str) -> str | None:
+def build_folder(sp: Split, group_by: str) -> str:
+    if group_by == "Location/Category":
+        loc_parts = split_breadcrumbs(sp.location)
+        cat_parts = split_breadcrumbs(sp.category)
+        segments = [slugify_path_segment(p) for p in (loc_parts + cat_parts)]
+        return "/".join(segments) + "/" if segments else ""
+    if group_by == "Template":
+        return slugify_path_segment(sp.template) + "/"
+    return ""
+
+
+def unique_path(path: str, seen: Counter) -> str:
     """
-    Accept:
-      - 'Field: value'
-      - 'Field value'
-      - two-line form:
-            Field
-            value
-    Returns None if not found.
+    `path`, or `stem_1.pdf`, `stem_2.pdf`, … if it was already handed out.
+    zipfile silently writes duplicate entries, and most unzippers then keep
+    only the last one.
     """
-    pat = re.compile(rf"^{field}\b\s*:?\s*(.*)$", flags=re.IGNORECASE)
-    i = 0
-    while i < len(lines):
-        s = lines[i].strip()
-        m = pat.match(s)
-        if m:
-            val = m.group(1).strip()
-            if val:
-                return val
-            # take next non-empty line
-            j = i + 1
-            while j < len(lines):
-                nxt = lines[j].strip()
-                if nxt:
-                    return nxt
-                j += 1
-            return None
-        i += 1
-    return None
-
-
-def extract_template_for_split(doc: fitz.Document, start_page: int) -> str:
-    p = max(0, start_page - 1)
-    txt = normalize_text(doc.load_page(p).get_text())
-    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-
-    for i, ln in enumerate(lines):
-        if re.match(r"^Template\b", ln, flags=re.IGNORECASE):
-            if ":" in ln:
-                val = ln.split(":", 1)[1].strip()
-                if val:
-                    return val
-            # header then next line
-            for j in range(i + 1, len(lines)):
-                nxt = lines[j].strip()
-                if nxt:
-                    return nxt
-            break
-
-    m = re.search(r"\bTemplate\s*[:\-]?\s*(.+)", txt, flags=re.IGNORECASE)
-    if m:
-        return m.group(1).splitlines()[0].strip()
-
-    return "Unknown Template"
-
-
-def extract_loc_cat_for_split(doc: fitz.Document, start_page: int, end_page: int) -> Tuple[str, str]:
+    n = seen[path]
+    seen[path] += 1
+    if n == 0:
+        return path
+    stem, ext = os.path.splitext(path)
+    while True:
+        candidate = f"{stem}_{n}{ext}"
+        if not seen[candidate]:
+            seen[candidate] += 1
+            return candidate
+        n += 1
+
+
+def iter_parts(
+    docs_info: List[Dict],
+    patterns: RemovePatterns,
+    prefix: str,
+    suffix: str,
+    remove_id_for_filenames: bool,
+    group_by: str,
+    optimize_size: bool = False,
+) -> Iterator[Tuple[str, bytes]]:
     """
-    Robust extraction that supports one-line and two-line layouts.
-    Prefer 'References and Attachments' pages; fall back to any page in the split.
+    Yield (zip path, part PDF bytes) for every split of every source PDF;
+    repeated paths are made unique (see `unique_path`).
+    PDFs not in `result_store("parts")` are split in parallel; each one's
+    parts are yielded as soon as that PDF is done. Part bytes do not depend
+    on any naming option, so prefix/suffix/pattern/grouping changes only
+    re-zip.
     """
-    location = None
-    category = None
-
-    # Pass 1: pages that look like references/assets summary
-    for p in range(start_page - 1, end_page):
-        txt = normalize_text(doc.load_page(p).get_text())
-        if "References and Attachments" in txt or "Assets (" in txt or ("References" in txt and "Attachments" in txt):
-            lines = [ln.strip() for ln in txt.splitlines()]
-            if location is None:
-                location = parse_field_from_lines(lines, "Location")
-            if category is None:
-                category = parse_field_from_lines(lines, "Category")
-            if location or category:
-                break
-
-    # Pass 2: any page within split
-    if location is None or category is None:
-        for p in range(start_page - 1, end_page):
-            txt = normalize_text(doc.load_page(p).get_text())
-            lines = [ln.strip() for ln in txt.splitlines()]
-            if location is None:
-                location = parse_field_from_lines(lines, "Location")
-            if category is None:
-                category = parse_field_from_lines(lines, "Category")
-            if location and category:
-                break
-
-    if not location:
-        location = "Unknown Location"
-    if not category:
-        category = "Unknown Category"
-
-    return location, category
+    store = result_store("parts")
+    cached = {info["hash"]: store_get(store, (info["hash"], optimize_size)) for info in docs_info}
+    missing = {info["hash"]: info for info in docs_info if cached[info["hash"]] is None}
+    built = parallel_map(
+        build_parts,
+        [info["bytes"] for info in missing.values()],
+        [[(sp.start, sp.end) for sp in info["splits"]] for info in missing.values()],
+        [optimize_size] * len(missing),
+    )
+
+    seen: Counter = Counter()
+    for info in docs_info:
+        h = info["hash"]
+        parts = cached[h]
+        if parts is None:
+            parts = cached[h] = next(built)
+            store_put(store, (h, optimize_size), parts, PART_STORE_MAX_BYTES, parts_nbytes)
+
+        for sp, part_bytes in zip(info["splits"], parts):
+            out_name = build_folder(sp, group_by) + build_filename(
+                sp.title, patterns, prefix, suffix, remove_id_for_filenames
+            )
+            yield unique_path(out_name, seen), part_bytes
 
 
-# ──────────────────────────────────────────────────────────────────────────────
-# SPLIT + ZIP (using precomputed splits/meta)
-# ──────────────────────────────────────────────────────────────────────────────
 def write_zip_for_docs(
     docs_info: List[Dict],
-    patterns: List[str],
+    patterns: RemovePatterns,
     prefix: str,
     suffix: str,
     remove_id_for_filenames: bool,
     group_by: str,
+    optimize_size: bool = False,
 ) -> io.BytesIO:
     buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w") as zf:
-        for info in docs_info:
-            pdf_bytes = info["bytes"]
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            try:
-                for sp in info["splits"]:
-                    title = sp["title"]
-                    start = sp["start"]
-                    end = sp["end"]
-                    template = sp["template"]
-                    location = sp["location"]
-                    category = sp["category"]
-
-                    # Folder path
-                    if group_by == "Location/Category":
-                        loc_parts = split_breadcrumbs(location)
-                        cat_parts = split_breadcrumbs(category)
-                        segments = [slugify_path_segment(p) for p in (loc_parts + cat_parts)]
-                        folder = "/".join(segments) + "/" if segments else ""
-                    elif group_by == "Template":
-                        folder = slugify_path_segment(template) + "/"
-                    else:
-                        folder = ""
-
-                    # Filename
-                    base = title
-                    if remove_id_for_filenames:
-                        base = re.sub(r"^#\s*\d+:\s*", "", base)
-                    base = apply_patterns(base, patterns)
-                    fname = slugify(base)
-                    fname = apply_patterns(fname, patterns)
-                    fname = re.sub(r"_+", "_", fname).strip("_")
-                    out_name = f"{folder}{prefix}{fname}{suffix}.pdf"
-
-                    # Write pages
-                    part_doc = fitz.open()
-                    for p in range(start - 1, end):
-                        part_doc.insert_pdf(doc, from_page=p, to_page=p)
-                    part_bytes = part_doc.write()
-                    part_doc.close()
-
-                    zf.writestr(out_name, part_bytes)
-            finally:
-                doc.close()
-
-    buf.seek(0)
+    # PDF content is already compressed, so entries are stored as-is
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for out_name, part_bytes in iter_parts(
+            docs_info, patterns, prefix, suffix, remove_id_for_filenames, group_by, optimize_size
+        ):
+            zf.writestr(out_name, part_bytes)
+
     return buf
 
 
-# ──────────────────────────────────────────────────────────────────────────────
-# UI CONTROLS
-# ──────────────────────────────────────────────────────────────────────────────
-uploads = st.file_uploader(
-    "Upload ACC Build PDF(s)",
-    type="pdf",
-    accept_multiple_files=True,
-)
+def main() -> None:
+    st.set_page_config(page_title="ACC Build TOC Splitter", layout="wide")
+    st.title("ACC Build TOC Splitter")
 
-remove_input = st.text_input("Remove patterns (* = wildcard, non-greedy)", "")
-prefix = st.text_input("Filename prefix", "")
-suffix = st.text_input("Filename suffix", "")
-remove_id_prefix = st.checkbox(
-    "Remove numeric ID prefix (e.g. ‘#6849: ’) from filenames only",
-    value=True,
-)
-group_by = st.selectbox(
-    "Group files in ZIP by",
-    ["None", "Location/Category", "Template"],
-    index=1
-)
+    # ──────────────────────────────────────────────────────────────────────────
+    # UI CONTROLS
+    # ──────────────────────────────────────────────────────────────────────────
+    uploads = st.file_uploader(
+        "Upload ACC Build PDF(s)",
+        type="pdf",
+        accept_multiple_files=True,
+    )
 
-with st.expander("📘 Regex & wildcard tips"):
-    st.markdown(
-        """
+    # options only take effect on "Apply", so typing in a field doesn't rerun
+    # the whole pipeline per edit
+    with st.form("options"):
+        remove_input = st.text_input("Remove patterns (* = wildcard, non-greedy)", "")
+        prefix = st.text_input("Filename prefix", "")
+        suffix = st.text_input("Filename suffix", "")
+        remove_id_prefix = st.checkbox(
+            "Remove numeric ID prefix (e.g. ‘#6849: ’) from filenames only",
+            value=True,
+        )
+        group_by = st.selectbox(
+            "Group files in ZIP by",
+            ["None", "Location/Category", "Template"],
+            index=1
+        )
+        optimize_size = st.checkbox("Optimize PDF size (slower)", value=False)
+        st.form_submit_button("Apply")
+
+    show_preview = st.checkbox("Show filename preview", value=True)
+
+    with st.expander("📘 Regex & wildcard tips"):
+        st.markdown(
+            """
 - **Exact text**: type it, e.g. `Checklist`
 - **Wildcard `*`** = any run of characters, **non-greedy** here:
   - `03.*_` removes `03.04_`, `03.03_`, etc.
@@ -296,123 +332,132 @@ with st.expander("📘 Regex & wildcard tips"):
 - We remove patterns **before and after** slugify, so `L2_` cleanly drops the underscore form.
 - Combine with commas: `03.*_, L2_`
 """
-    )
-
-
-# ──────────────────────────────────────────────────────────────────────────────
-# PIPELINE (read → split → meta → preview → zip)
-# ──────────────────────────────────────────────────────────────────────────────
-if uploads:
-    patterns = build_patterns(remove_input)
-
-    t0 = time.perf_counter()
-    progress = st.progress(0, text="Reading PDFs…")
-    step = 0
-
-    docs_info: List[Dict] = []
-    total_pages = 0
-    total_forms = 0
+        )
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # PIPELINE (read → split → meta → preview → zip)
+    # ──────────────────────────────────────────────────────────────────────────
+    if uploads:
+        patterns = build_patterns(remove_input)
+
+        t0 = time.perf_counter()
+        progress = st.progress(0, text="Reading PDFs…")
+
+        docs_info: List[Dict] = []
+        total_pages = 0
+        total_forms = 0
+
+        # getvalue(): no cursor state; shares the upload buffer
+        files = [(f.name, f.getvalue()) for f in uploads]
+        hashes = [hash_pdf(b) for _, b in files]
+
+        # parse only PDFs not seen before, in parallel worker processes
+        store = result_store("parsed")
+        parsed_by_hash = {h: store_get(store, h) for h in hashes}
+        missing = {h: b for (_, b), h in zip(files, hashes) if parsed_by_hash[h] is None}
+        step = len(files) - len(missing)
+        for h, parsed in zip(missing, parallel_map(parse_pdf, missing.values())):
+            parsed_by_hash[h] = parsed
+            if "error" not in parsed:
+                store_put(store, h, parsed, PARSE_STORE_MAX_PDFS)
+            step += 1
+            progress.progress(step / len(files), text=f"Processed {step}/{len(files)}")
+        progress.progress(1.0, text=f"Processed {len(files)}/{len(files)}")
+
+        for (name, b), h in zip(files, hashes):
+            parsed = parsed_by_hash[h]
+            if "error" in parsed:
+                st.warning(f"Skipped {name}: {parsed['error']}")
+                continue
+            total_pages += parsed["page_count"]
+            total_forms += len(parsed["splits"])
+            docs_info.append({"name": name, "hash": h, "bytes": b, "splits": parsed["splits"]})
+
+        # PREVIEW READY TIMER
+        t1 = time.perf_counter()
+        elapsed = t1 - t0
+        mins, secs = divmod(int(elapsed), 60)
+
+        # METRICS
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Source PDFs", len(docs_info))  # skipped uploads were warned about above
+        c2.metric("Total pages", total_pages)
+        c3.metric("Total forms", total_forms)
+        c4.metric("Preview ready", f"{mins:02d}:{secs:02d}")
+
+        # PREVIEW (table is only built when shown)
+        if show_preview:
+            st.subheader("Filename & Page-Range Preview")
+            # column lists, turned into a DataFrame in one go
+            sources: List[str] = []
+            folders: List[str] = []
+            titles: List[str] = []
+            page_ranges: List[str] = []
+            filenames: List[str] = []
+            seen: Counter = Counter()  # same de-duplication as the ZIP
+            for info in docs_info:
+                for sp in info["splits"]:
+                    title = sp.title
+                    template = sp.template
+                    location = sp.location
+                    category = sp.category
 
-    for f in uploads:
-        b = f.read()
-        doc = fitz.open(stream=b, filetype="pdf")
-        try:
-            total_pages += doc.page_count
-
-            toc_pages = detect_toc_pages(doc)
-            entries = parse_toc(doc, toc_pages)
-            splits = split_ranges(entries, doc.page_count)
-            total_forms += len(splits)
-
-            # per-split metadata
-            split_rows = []
-            for (title, start, end) in splits:
-                template = extract_template_for_split(doc, start)
-                location, category = extract_loc_cat_for_split(doc, start, end)
-                split_rows.append(
-                    {
-                        "title": title,
-                        "start": start,
-                        "end": end,
-                        "template": template,
-                        "location": location,
-                        "category": category,
-                    }
-                )
-
-            docs_info.append({"name": f.name, "bytes": b, "splits": split_rows})
-        finally:
-            doc.close()
-
-        step += 1
-        progress.progress(step / len(uploads), text=f"Processed {step}/{len(uploads)}")
-
-    # PREVIEW READY TIMER
-    t1 = time.perf_counter()
-    elapsed = t1 - t0
-    mins, secs = divmod(int(elapsed), 60)
-
-    # METRICS
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Source PDFs", len(uploads))
-    c2.metric("Total pages", total_pages)
-    c3.metric("Total forms", total_forms)
-    c4.metric("Preview ready", f"{mins:02d}:{secs:02d}")
-
-    # PREVIEW
-    st.subheader("Filename & Page-Range Preview")
-    preview_rows = []
-    for info in docs_info:
-        for sp in info["splits"]:
-            title = sp["title"]
-            start, end = sp["start"], sp["end"]
-            template = sp["template"]
-            location = sp["location"]
-            category = sp["category"]
-
-            if group_by == "Location/Category":
-                folder_display = " > ".join(split_breadcrumbs(location) + split_breadcrumbs(category))
-            elif group_by == "Template":
-                folder_display = template
-            else:
-                folder_display = ""
-
-            # Filename (ID removed only from filename)
-            base = title
-            if remove_id_prefix:
-                base = re.sub(r"^#\s*\d+:\s*", "", base)
-            base = apply_patterns(base, patterns)
-            fname = slugify(base)
-            fname = apply_patterns(fname, patterns)
-            fname = re.sub(r"_+", "_", fname).strip("_")
-            final_name = f"{prefix}{fname}{suffix}.pdf"
-
-            preview_rows.append(
+                    if group_by == "Location/Category":
+                        folder_display = " > ".join(split_breadcrumbs(location) + split_breadcrumbs(category))
+                    elif group_by == "Template":
+                        folder_display = template
+                    else:
+                        folder_display = ""
+
+                    sources.append(info["name"])
+                    folders.append(folder_display)
+                    titles.append(title)
+                    page_ranges.append(f"{sp.start}-{sp.end}")
+                    # Filename (ID removed only from filename)
+                    folder = build_folder(sp, group_by)
+                    fname = build_filename(title, patterns, prefix, suffix, remove_id_prefix)
+                    filenames.append(unique_path(folder + fname, seen)[len(folder):])
+
+            df = pd.DataFrame(
                 {
-                    "Source PDF": info["name"],
-                    "Folder": folder_display,
-                    "Form Name": title,
-                    "Pages": f"{start}-{end}",
-                    "Filename": final_name,
+                    "Source PDF": sources,
+                    "Folder": folders,
+                    "Form Name": titles,
+                    "Pages": page_ranges,
+                    "Filename": filenames,
                 }
             )
-
-    df = pd.DataFrame(preview_rows)
-    st.dataframe(df, use_container_width=True)
-
-    st.divider()
-    st.write("When you click download, the ZIP is assembled with the same previewed folder structure.")
-    zip_buf = write_zip_for_docs(
-        docs_info=docs_info,
-        patterns=patterns,
-        prefix=prefix,
-        suffix=suffix,
-        remove_id_for_filenames=remove_id_prefix,
-        group_by=group_by,
-    )
-    st.download_button(
-        "Download all splits",
-        zip_buf,
-        file_name="acc_build_forms.zip",
-        mime="application/zip",
-    )
+            st.dataframe(df, use_container_width=True)
+
+        st.divider()
+        st.write("When you click download, the ZIP is assembled with the same previewed folder structure.")
+        # the archive only changes with the uploads or the applied options, so
+        # reruns from the preview toggle or the download click reuse this
+        # session's copy (download_button holds the same bytes anyway)
+        zip_key = (
+            tuple(info["hash"] for info in docs_info),
+            remove_input, prefix, suffix, remove_id_prefix, group_by, optimize_size,
+        )
+        if st.session_state.get("zip_key") != zip_key:
+            st.session_state["zip_bytes"] = write_zip_for_docs(
+                docs_info=docs_info,
+                patterns=patterns,
+                prefix=prefix,
+                suffix=suffix,
+                remove_id_for_filenames=remove_id_prefix,
+                group_by=group_by,
+                optimize_size=optimize_size,
+            ).getvalue()
+            st.session_state["zip_key"] = zip_key
+        st.download_button(
+            "Download all splits",
+            st.session_state["zip_bytes"],
+            file_name="acc_build_forms.zip",
+            mime="application/zip",
+        )
+
+
+# spawned workers (see `worker_pool`) run this file as `__mp_main__`; they only
+# need the definitions above, not the app
+if __name__ == "__main__":
+    main()
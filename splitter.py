@@ -0,0 +1,357 @@
+"""
+PDF-side work of the splitter: page text, TOC parsing, per-form metadata and
+writing the per-form PDFs. Kept free of Streamlit so worker processes can
+import it (see `parallel_map` in app.py).
+"""
+import functools
+import hashlib
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Tuple, Dict
+
+import fitz  # PyMuPDF
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# TEXT NORMALIZATION
+# ──────────────────────────────────────────────────────────────────────────────
+NBSP = "\xa0"
+HSPACE_RX = re.compile(r"[ \t]+")
+SPACE_BEFORE_NL_RX = re.compile(r"\s+\n")
+SPACE_AFTER_NL_RX = re.compile(r"\n\s+")
+WS_AT_NL_RX = re.compile(r"\s\n|\n\s")  # anything the two passes above would touch
+
+def normalize_text(s: str) -> str:
+    if not s:
+        return ""
+    # fast paths: most extracted pages need none of the rewrites below
+    if NBSP in s or "–" in s or "—" in s:
+        s = s.replace(NBSP, " ")
+        s = s.replace("–", "-").replace("—", "-")
+    if "\t" not in s and "  " not in s and not WS_AT_NL_RX.search(s):
+        return s
+    s = HSPACE_RX.sub(" ", s)
+    s = SPACE_BEFORE_NL_RX.sub("\n", s)
+    s = SPACE_AFTER_NL_RX.sub("\n", s)
+    return s
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PAGE TEXT (extracted at most once per page)
+# ──────────────────────────────────────────────────────────────────────────────
+class PageTexts:
+    """
+    Lazy, cached sequence of normalized page texts for one document.
+    TOC scanning and metadata extraction read through this, so a page is
+    only extracted the first time any of them asks for it.
+    """
+
+    def __init__(self, doc: fitz.Document):
+        self.doc = doc
+        self._cache: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return self.doc.page_count
+
+    def __getitem__(self, i: int) -> str:
+        txt = self._cache.get(i)
+        if txt is None:
+            # same output as page.get_text(), minus its Python-level dispatch;
+            # get_textpage() defaults to flags=0, so pass get_text()'s flags
+            tp = self.doc.load_page(i).get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+            txt = normalize_text(tp.extractText())
+            self._cache[i] = txt
+        return txt
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# TOC PARSING
+# ──────────────────────────────────────────────────────────────────────────────
+TOC_PAGE_RX = re.compile(r"^#\s*\d+:", re.MULTILINE)
+TOC_ENTRY_RX = re.compile(r"#\s*\d+:\s*(.+?)\s*\.{3,}\s*(\d+)", re.MULTILINE)
+TOC_SEARCH_MAX_PAGES = 64  # a TOC that hasn't started by here isn't coming
+
+def scan_toc(texts: PageTexts) -> Tuple[List[int], List[Tuple[str, int]]]:
+    """
+    Detect TOC pages, then parse their entries with one pass over the joined
+    TOC text (an entry whose page number wraps onto the next page is kept).
+    TOC pages are contiguous at the front of an ACC Build report, so stop at
+    the first non-TOC page after the TOC started, and don't read a whole
+    PDF that has no TOC near the front.
+    """
+    pages: List[int] = []
+    for i in range(len(texts)):
+        if not pages and i >= TOC_SEARCH_MAX_PAGES:
+            break
+        if not TOC_PAGE_RX.search(texts[i]):
+            if pages:
+                break
+            continue
+        pages.append(i + 1)  # 1-based
+
+    toc_text = "\n".join(texts[p - 1] for p in pages)
+    entries = [
+        (m.group(1).strip(), int(m.group(2)))
+        for m in TOC_ENTRY_RX.finditer(toc_text)
+    ]
+    return pages, entries
+
+
+def split_ranges(entries: List[Tuple[str, int]], total_pages: int) -> List[Tuple[str, int, int]]:
+    out: List[Tuple[str, int, int]] = []
+    for i, (title, start) in enumerate(entries):
+        end = entries[i + 1][1] - 1 if i + 1 < len(entries) else total_pages
+        out.append((title, start, end))
+    return out
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PER-SPLIT METADATA
+# ──────────────────────────────────────────────────────────────────────────────
+@functools.lru_cache(maxsize=None)
+def field_rx(field: str) -> re.Pattern:
+    return re.compile(rf"^{field}\b\s*:?\s*(.*)$", flags=re.IGNORECASE)
+
+
+def parse_field_from_lines(lines: List[str], field: str) -> str | None:
+    """
+    Accept:
+      - 'Field: value'
+      - 'Field value'
+      - two-line form:
+            Field
+            value
+    Returns None if not found.
+    """
+    pat = field_rx(field)
+    i = 0
+    while i < len(lines):
+        s = lines[i].strip()
+        m = pat.match(s)
+        if m:
+            val = m.group(1).strip()
+            if val:
+                return val
+            # take next non-empty line
+            j = i + 1
+            while j < len(lines):
+                nxt = lines[j].strip()
+                if nxt:
+                    return nxt
+                j += 1
+            return None
+        i += 1
+    return None
+
+
+TEMPLATE_LINE_RX = re.compile(r"^Template\b", re.IGNORECASE)
+TEMPLATE_ANY_RX = re.compile(r"\bTemplate\s*[:\-]?\s*(.+)", re.IGNORECASE)
+
+def extract_template_for_split(texts: PageTexts, start_page: int) -> str:
+    txt = texts[max(0, start_page - 1)]
+    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
+
+    for i, ln in enumerate(lines):
+        if TEMPLATE_LINE_RX.match(ln):
+            if ":" in ln:
+                val = ln.split(":", 1)[1].strip()
+                if val:
+                    return val
+            # header then next line
+            for j in range(i + 1, len(lines)):
+                nxt = lines[j].strip()
+                if nxt:
+                    return nxt
+            break
+
+    m = TEMPLATE_ANY_RX.search(txt)
+    if m:
+        return m.group(1).splitlines()[0].strip()
+
+    return "Unknown Template"
+
+
+def is_references_page(txt: str) -> bool:
+    # "References and Attachments" is covered by the References+Attachments check
+    return "Assets (" in txt or ("References" in txt and "Attachments" in txt)
+
+
+def extract_loc_cat_for_split(texts: PageTexts, start_page: int, end_page: int) -> Tuple[str, str]:
+    """
+    Robust extraction that supports one-line and two-line layouts.
+    Prefer 'References and Attachments' pages; fall back to any page in the split.
+    ACC Build puts that section at the end of a form, so pass 1 scans backwards.
+    """
+    location = None
+    category = None
+    searched = set()  # pages pass 1 already checked for both fields
+
+    # Pass 1: pages that look like references/assets summary
+    for p in range(end_page - 1, start_page - 2, -1):
+        txt = texts[p]
+        if is_references_page(txt):
+            searched.add(p)
+            lines = [ln.strip() for ln in txt.splitlines()]
+            if location is None:
+                location = parse_field_from_lines(lines, "Location")
+            if category is None:
+                category = parse_field_from_lines(lines, "Category")
+            if location or category:
+                break
+
+    # Pass 2: any page within split
+    if location is None or category is None:
+        for p in range(start_page - 1, end_page):
+            if p in searched:
+                continue
+            txt = texts[p]
+            # cheap keyword precheck before splitting lines / running regexes
+            low = txt.lower()
+            want_loc = location is None and "location" in low
+            want_cat = category is None and "category" in low
+            if not (want_loc or want_cat):
+                continue
+            lines = [ln.strip() for ln in txt.splitlines()]
+            if want_loc:
+                location = parse_field_from_lines(lines, "Location")
+            if want_cat:
+                category = parse_field_from_lines(lines, "Category")
+            if location and category:
+                break
+
+    if not location:
+        location = "Unknown Location"
+    if not category:
+        category = "Unknown Category"
+
+    return location, category
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PER-PDF PARSE
+# ──────────────────────────────────────────────────────────────────────────────
+@dataclass(slots=True, frozen=True)
+class Split:
+    """One form: its TOC title, 1-based inclusive page range and metadata."""
+    title: str
+    start: int
+    end: int
+    template: str
+    location: str
+    category: str
+
+
+def hash_pdf(pdf_bytes: bytes) -> str:
+    return hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+
+
+def parse_pdf(pdf_bytes: bytes) -> Dict:
+    """
+    TOC + per-split metadata for one PDF. Runs in a worker process; the app
+    keeps results by content hash. Failures come back as {"error": ...} so
+    one bad upload doesn't stop the batch.
+    """
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    try:
+        texts = PageTexts(doc)
+        _, entries = scan_toc(texts)
+        splits = split_ranges(entries, doc.page_count)
+
+        split_rows: List[Split] = []
+        for (title, start, end) in splits:
+            template = extract_template_for_split(texts, start)
+            location, category = extract_loc_cat_for_split(texts, start, end)
+            split_rows.append(Split(title, start, end, template, location, category))
+        return {"page_count": doc.page_count, "splits": split_rows}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        doc.close()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SPLIT
+# ──────────────────────────────────────────────────────────────────────────────
+PAGE_FINGERPRINT_KEYS = ("Resources", "Annots")
+
+def range_prekey(doc: fitz.Document, start_page: int, end_page: int) -> Tuple[int, bytes]:
+    """
+    Cheap pre-check for `range_fingerprint`: page count plus the first page's
+    raw content. Ranges that differ here cannot produce identical parts.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for cx in doc.load_page(start_page - 1).get_contents():
+        h.update(doc.xref_stream_raw(cx))
+    return end_page - start_page, h.digest()
+
+
+def range_fingerprint(doc: fitz.Document, start_page: int, end_page: int) -> bytes:
+    """
+    Content key for a page range: the raw content streams plus everything
+    else that affects rendering. Equal keys mean the split PDFs are identical.
+    Rotation and boxes are taken resolved from the page, so values inherited
+    from the page tree are compared, not the literal "null".
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for p in range(start_page - 1, end_page):
+        page = doc.load_page(p)
+        xref = page.xref
+        for key in PAGE_FINGERPRINT_KEYS:
+            kind, val = doc.xref_get_key(xref, key)
+            if key == "Resources":
+                if kind == "xref":
+                    # per-page resource dicts usually point at shared fonts/images
+                    val = doc.xref_object(int(val.split()[0]), compressed=True)
+                elif kind == "null":
+                    # inherited from the page tree
+                    val = doc.xref_get_key(xref, "Parent")[1]
+            h.update(val.encode())
+        h.update(f"{page.rotation}|{tuple(page.mediabox)}|{tuple(page.cropbox)}".encode())
+        for cx in page.get_contents():
+            h.update(doc.xref_stream_raw(cx))
+        h.update(b"\0")
+    return h.digest()
+
+
+def build_parts(
+    pdf_bytes: bytes,
+    ranges: List[Tuple[int, int]],
+    optimize_size: bool = False,
+) -> List[bytes]:
+    """
+    Serialize one PDF per (start, end) page range of a source PDF.
+    Repeated forms reuse the bytes of the first identical range.
+    `optimize_size` trades speed for smaller files (object dedup + deflate).
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    part_cache: Dict[bytes, bytes] = {}  # range fingerprint -> part PDF
+    parts: List[bytes] = []
+    try:
+        # two TOC entries on one page give end < start, which insert_pdf would
+        # copy backwards; such a form gets just its start page
+        ranges = [(start, max(start, end)) for start, end in ranges]
+        # only ranges sharing a pre-key can repeat; fingerprint just those
+        prekeys = [range_prekey(doc, start, end) for start, end in ranges]
+        repeated = {k for k, n in Counter(prekeys).items() if n > 1}
+        for (start, end), prekey in zip(ranges, prekeys):
+            key = range_fingerprint(doc, start, end) if prekey in repeated else None
+            part_bytes = part_cache.get(key) if key else None
+            if part_bytes is None:
+                part_doc = fitz.open()
+                part_doc.insert_pdf(doc, from_page=start - 1, to_page=end - 1)
+                if optimize_size:
+                    part_bytes = part_doc.tobytes(garbage=3, deflate=True)
+                else:
+                    # copied streams keep their filters; no GC or re-deflate pass
+                    part_bytes = part_doc.tobytes(garbage=0, deflate=False, clean=False)
+                part_doc.close()
+                if key:
+                    part_cache[key] = part_bytes
+            parts.append(part_bytes)
+    finally:
+        doc.close()
+    return parts